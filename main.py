@@ -1,17 +1,121 @@
 import os
-import json
+import asyncio
+import gzip
+import hashlib
+import html
+import io
+import logging
 import re
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from xml.etree import ElementTree as ET
+import httpx
+import ijson
+import orjson
 import requests
-from fastapi import FastAPI, HTTPException
+from cachetools import TTLCache
+from diskcache import Cache
+from fastapi import FastAPI, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from openai import OpenAI
+from rapidfuzz import fuzz
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 from youtube_transcript_api import YouTubeTranscriptApi
 
 load_dotenv()
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+if not os.environ.get("AIPIPE_TOKEN"):
+    raise RuntimeError("AIPIPE_TOKEN environment variable is not set")
+
+# One LLM client per process so its connection pool is reused across requests
+_CLIENT = AsyncOpenAI(
+    api_key=os.environ["AIPIPE_TOKEN"],
+    base_url="https://aipipe.org/openrouter/v1"
+)
+LLM_MODEL = os.environ.get("LLM_MODEL", "google/gemini-2.5-flash")
+# Answers are a few tokens of JSON; cap decoding so nothing else is paid for
+LLM_MAX_TOKENS = 40
+# Gemini 2.5 models think by default and reasoning tokens count against
+# max_tokens, so a small cap can be spent before any answer is written.
+# Flash can switch thinking off; Pro cannot (its minimum thinking budget is
+# 128 tokens), so Pro-class models get the minimum budget plus headroom on
+# top of the answer cap instead.
+if "-pro" in LLM_MODEL:
+    LLM_REASONING = {"max_tokens": 128}
+    LLM_REASONING_TOKENS = 512
+else:
+    LLM_REASONING = {"max_tokens": 0}
+    LLM_REASONING_TOKENS = 0
+
+# Persistent on-disk cache shared by all workers on the same host
+cache = Cache(os.environ.get("CACHE_DIR", ".cache"))
+TRANSCRIPT_TTL = 7 * 24 * 60 * 60  # 7 days
+ANSWER_TTL = 24 * 60 * 60  # 1 day
+
+# Prompt budget for the transcript sent to the LLM
+MAX_PROMPT_CHARS = 12000
+
+# Minimum rapidfuzz partial_ratio score to trust a local match over the LLM
+FUZZY_THRESHOLD = 85
+
+# In-process cache in front of the disk cache for hot videos. Entries expire
+# after an hour and the least recently used are evicted first when full.
+# Only touched from the event loop thread.
+_transcript_memo = TTLCache(maxsize=512, ttl=60 * 60)
+
+# Concurrent LLM lookups are coalesced into batches of up to MAX_BATCH
+# requests arriving within MAX_WAIT seconds of each other
+MAX_BATCH = 8
+MAX_WAIT = 0.15
+
+# youtube-transcript-api blocks a thread per fetch and cancelling the race
+# does not stop it, so it gets its own small pool with a per-request timeout.
+# The default executor stays free for cache I/O and local matching.
+YT_API_WORKERS = 4
+YT_API_TIMEOUT = 10.0
+
+# Shared HTTP client (connection pooling + HTTP/2), youtube-transcript-api
+# thread pool and LLM batch queue, all created in lifespan
+http_client: httpx.AsyncClient | None = None
+yt_api_executor: ThreadPoolExecutor | None = None
+llm_queue: asyncio.Queue | None = None
+_batch_tasks: set = set()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global http_client, yt_api_executor, llm_queue
+    http_client = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(10.0, connect=3.0),
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    )
+    yt_api_executor = ThreadPoolExecutor(max_workers=YT_API_WORKERS, thread_name_prefix="yt-api")
+    llm_queue = asyncio.Queue()
+    batcher = asyncio.create_task(llm_batcher())
+    try:
+        yield
+    finally:
+        # Stop the batcher and in-flight LLM calls, then fail anything still
+        # queued so no request is left waiting on its future
+        tasks = [batcher, *_batch_tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        while not llm_queue.empty():
+            fail_llm_futures(queued_futures([llm_queue.get_nowait()]), RuntimeError("Server is shutting down"))
+        await http_client.aclose()
+        yt_api_executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,6 +123,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browser callers read the cache status and send the ETag back
+    expose_headers=["ETag", "X-Cache"],
 )
 
 
@@ -33,20 +139,45 @@ class AskResponse(BaseModel):
     topic: str
 
 
+_VID_RE = re.compile(
+    r"(?:youtu\.be/|youtube(?:-nocookie)?\.com/(?:watch\?(?:.*&)?v=|embed/|v/|shorts/|live/))"
+    r"([0-9A-Za-z_-]{11})"
+)
+_VID_ONLY = re.compile(r"[0-9A-Za-z_-]{11}")
+_WORD_RE = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=4096)
 def extract_video_id(url: str) -> str:
-    patterns = [
-        r"(?:v=|\/)([0-9A-Za-z_-]{11}).*",
-        r"youtu\.be\/([0-9A-Za-z_-]{11})",
-        r"embed\/([0-9A-Za-z_-]{11})",
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
+    # Bare video ID
+    if len(url) == 11 and _VID_ONLY.fullmatch(url):
+        return url
+
+    match = _VID_RE.search(url)
+    if match:
+        return match.group(1)
     raise ValueError(f"Could not extract video ID from URL: {url}")
 
 
-def fetch_captions_from_tracks(caption_tracks: list, headers: dict) -> list:
+def parse_caption_xml(content: bytes) -> list:
+    """
+    Stream-parse timedtext XML (<text start="...">) into transcript entries.
+    Elements are cleared as they are consumed so memory stays flat.
+    """
+    transcript = []
+    try:
+        for _, elem in ET.iterparse(io.BytesIO(content), events=("end",)):
+            if elem.tag == "text":
+                text = html.unescape("".join(elem.itertext())).strip()
+                if text:
+                    transcript.append((float(elem.get("start", "0")), text))
+                elem.clear()
+    except ET.ParseError:
+        pass
+    return transcript
+
+
+async def fetch_captions_from_tracks(caption_tracks: list, headers: dict) -> list:
     """Helper to fetch and parse captions from track list."""
     if not caption_tracks:
         raise ValueError("No captions available")
@@ -70,41 +201,122 @@ def fetch_captions_from_tracks(caption_tracks: list, headers: dict) -> list:
     else:
         caption_url += '?fmt=json3'
     
-    caption_response = requests.get(caption_url, headers=headers, timeout=10)
+    caption_response = await http_client.get(caption_url, headers=headers)
     caption_response.raise_for_status()
     
     # Parse JSON format
     try:
-        caption_data = caption_response.json()
-        transcript = []
-        for event in caption_data.get('events', []):
-            if 'segs' in event:
-                start = event.get('tStartMs', 0) / 1000.0
-                text = ''.join(seg.get('utf8', '') for seg in event['segs'])
-                if text.strip():
-                    transcript.append({"text": text.strip(), "start": start})
+        caption_data = orjson.loads(caption_response.content)
+        transcript = [
+            (event.get('tStartMs', 0) / 1000.0, text)
+            for event in caption_data.get('events', [])
+            if 'segs' in event
+            and (text := ''.join(seg.get('utf8', '') for seg in event['segs']).strip())
+        ]
         if transcript:
             return transcript
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         pass
     
     # Fallback: parse XML format
-    transcript = []
-    for m in re.finditer(r'<text start="([\d.]+)"[^>]*>([^<]*)</text>', caption_response.text):
-        start = float(m.group(1))
-        text = m.group(2)
-        text = text.replace('&amp;', '&').replace('&lt;', '<').replace('&gt;', '>')
-        text = text.replace('&#39;', "'").replace('&quot;', '"').replace('&nbsp;', ' ')
-        if text.strip():
-            transcript.append({"text": text.strip(), "start": start})
-    
+    transcript = parse_caption_xml(caption_response.content)
     if not transcript:
         raise ValueError("Could not parse captions")
     
     return transcript
 
 
-def get_transcript_innertube_android(video_id: str) -> list:
+class TimeoutSession(requests.Session):
+    """requests.Session that applies YT_API_TIMEOUT when the caller sets none."""
+
+    def request(self, *args, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = YT_API_TIMEOUT
+        return super().request(*args, **kwargs)
+
+
+_ytt_local = threading.local()
+
+
+def get_youtube_transcript_api() -> YouTubeTranscriptApi:
+    """
+    Return this thread's YouTubeTranscriptApi (the library is not
+    thread-safe). Each keeps its own keep-alive session, so repeat fetches
+    from the same worker thread skip the TCP/TLS handshake. The library
+    passes no timeout of its own, so the session supplies one.
+    """
+    ytt = getattr(_ytt_local, "ytt", None)
+    if ytt is None:
+        ytt = _ytt_local.ytt = YouTubeTranscriptApi(http_client=TimeoutSession())
+    return ytt
+
+
+def get_transcript_youtube_api(video_id: str) -> list:
+    """
+    Use the youtube-transcript-api package.
+    Blocking; callers run it in a worker thread.
+    """
+    fetched = get_youtube_transcript_api().fetch(video_id)
+    transcript = [(s.start, s.text) for s in fetched]
+    if not transcript:
+        raise ValueError("Empty transcript")
+    return transcript
+
+
+async def fetch_with_youtube_api(video_id: str) -> list:
+    """Run get_transcript_youtube_api on its dedicated thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(yt_api_executor, get_transcript_youtube_api, video_id)
+
+
+CAPTION_TRACKS_PREFIX = "captions.playerCaptionsTracklistRenderer.captionTracks"
+CAPTION_TRACK_ITEM = CAPTION_TRACKS_PREFIX + ".item"
+
+
+async def fetch_innertube_caption_tracks(innertube_url: str, payload: dict, headers: dict) -> list:
+    """
+    POST to the Innertube player endpoint and stream-parse only the
+    playability status and caption tracks out of the response, instead of
+    decoding the whole player response. Stops reading once the caption track
+    list has been parsed.
+    """
+    events = ijson.sendable_list()
+    parser = ijson.parse_coro(events, use_float=True)
+    status, reason = None, "Unknown"
+    caption_tracks = []
+    builder = None
+    tracks_done = False
+
+    async with http_client.stream("POST", innertube_url, content=orjson.dumps(payload), headers=headers) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            parser.send(chunk)
+            for prefix, event, value in events:
+                if prefix == "playabilityStatus.status":
+                    status = value
+                elif prefix == "playabilityStatus.reason":
+                    reason = value
+                elif prefix == CAPTION_TRACK_ITEM and event == "start_map":
+                    builder = ijson.ObjectBuilder()
+                    builder.event(event, value)
+                elif builder is not None and prefix.startswith(CAPTION_TRACK_ITEM):
+                    builder.event(event, value)
+                    if prefix == CAPTION_TRACK_ITEM and event == "end_map":
+                        caption_tracks.append(builder.value)
+                        builder = None
+                elif prefix == CAPTION_TRACKS_PREFIX and event == "end_array":
+                    tracks_done = True
+            del events[:]
+            if tracks_done:
+                break
+
+    if status == 'ERROR':
+        raise ValueError(f"Video unavailable: {reason}")
+
+    return caption_tracks
+
+
+async def get_transcript_innertube_android(video_id: str) -> list:
     """
     Use YouTube's Innertube API with Android client.
     Android client is often less restricted than web.
@@ -133,22 +345,12 @@ def get_transcript_innertube_android(video_id: str) -> list:
         'X-Youtube-Client-Version': '19.09.37',
     }
     
-    response = requests.post(innertube_url, json=payload, headers=headers, timeout=15)
-    response.raise_for_status()
-    
-    player_response = response.json()
+    caption_tracks = await fetch_innertube_caption_tracks(innertube_url, payload, headers)
     
-    playability = player_response.get('playabilityStatus', {})
-    if playability.get('status') == 'ERROR':
-        raise ValueError(f"Video unavailable: {playability.get('reason', 'Unknown')}")
-    
-    captions = player_response.get('captions', {})
-    caption_tracks = captions.get('playerCaptionsTracklistRenderer', {}).get('captionTracks', [])
-    
-    return fetch_captions_from_tracks(caption_tracks, headers)
+    return await fetch_captions_from_tracks(caption_tracks, headers)
 
 
-def get_transcript_innertube_ios(video_id: str) -> list:
+async def get_transcript_innertube_ios(video_id: str) -> list:
     """
     Use YouTube's Innertube API with iOS client.
     """
@@ -176,22 +378,12 @@ def get_transcript_innertube_ios(video_id: str) -> list:
         'X-Youtube-Client-Version': '19.09.3',
     }
     
-    response = requests.post(innertube_url, json=payload, headers=headers, timeout=15)
-    response.raise_for_status()
-    
-    player_response = response.json()
-    
-    playability = player_response.get('playabilityStatus', {})
-    if playability.get('status') == 'ERROR':
-        raise ValueError(f"Video unavailable: {playability.get('reason', 'Unknown')}")
+    caption_tracks = await fetch_innertube_caption_tracks(innertube_url, payload, headers)
     
-    captions = player_response.get('captions', {})
-    caption_tracks = captions.get('playerCaptionsTracklistRenderer', {}).get('captionTracks', [])
-    
-    return fetch_captions_from_tracks(caption_tracks, headers)
+    return await fetch_captions_from_tracks(caption_tracks, headers)
 
 
-def get_transcript_innertube_tv(video_id: str) -> list:
+async def get_transcript_innertube_tv(video_id: str) -> list:
     """
     Use YouTube's Innertube API with TV embedded client.
     """
@@ -214,22 +406,12 @@ def get_transcript_innertube_tv(video_id: str) -> list:
         'User-Agent': 'Mozilla/5.0 (SMART-TV; Linux; Tizen 5.0) AppleWebKit/537.36',
     }
     
-    response = requests.post(innertube_url, json=payload, headers=headers, timeout=15)
-    response.raise_for_status()
-    
-    player_response = response.json()
-    
-    playability = player_response.get('playabilityStatus', {})
-    if playability.get('status') == 'ERROR':
-        raise ValueError(f"Video unavailable: {playability.get('reason', 'Unknown')}")
-    
-    captions = player_response.get('captions', {})
-    caption_tracks = captions.get('playerCaptionsTracklistRenderer', {}).get('captionTracks', [])
+    caption_tracks = await fetch_innertube_caption_tracks(innertube_url, payload, headers)
     
-    return fetch_captions_from_tracks(caption_tracks, headers)
+    return await fetch_captions_from_tracks(caption_tracks, headers)
 
 
-def get_transcript_third_party(video_id: str) -> list:
+async def get_transcript_third_party(video_id: str) -> list:
     """
     Use third-party transcript API as final fallback.
     Tries multiple free services.
@@ -242,19 +424,23 @@ def get_transcript_third_party(video_id: str) -> list:
     # Try kome.ai (free, no auth required for basic usage)
     try:
         url = f"https://kome.ai/api/tools/youtube-transcript?video_id={video_id}"
-        response = requests.get(url, headers=headers, timeout=15)
+        response = await http_client.get(url, headers=headers)
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             transcript = []
             # Parse kome.ai response format
             if isinstance(data, list):
-                for item in data:
-                    if 'text' in item and 'start' in item:
-                        transcript.append({"text": item['text'], "start": float(item['start'])})
+                transcript = [
+                    (float(item['start']), item['text'])
+                    for item in data
+                    if 'text' in item and 'start' in item
+                ]
             elif 'transcript' in data:
-                for item in data['transcript']:
-                    if 'text' in item:
-                        transcript.append({"text": item['text'], "start": float(item.get('start', 0))})
+                transcript = [
+                    (float(item.get('start', 0)), item['text'])
+                    for item in data['transcript']
+                    if 'text' in item
+                ]
             if transcript:
                 return transcript
     except Exception:
@@ -263,17 +449,10 @@ def get_transcript_third_party(video_id: str) -> list:
     # Try youtubetranscript.com
     try:
         url = f"https://youtubetranscript.com/?server_vid2={video_id}"
-        response = requests.get(url, headers=headers, timeout=15)
+        response = await http_client.get(url, headers=headers)
         if response.status_code == 200:
             # Parse XML response
-            transcript = []
-            for m in re.finditer(r'<text start="([\d.]+)"[^>]*>([^<]*)</text>', response.text):
-                start = float(m.group(1))
-                text = m.group(2)
-                text = text.replace('&amp;', '&').replace('&lt;', '<').replace('&gt;', '>')
-                text = text.replace('&#39;', "'").replace('&quot;', '"')
-                if text.strip():
-                    transcript.append({"text": text.strip(), "start": start})
+            transcript = parse_caption_xml(response.content)
             if transcript:
                 return transcript
     except Exception:
@@ -282,41 +461,56 @@ def get_transcript_third_party(video_id: str) -> list:
     raise ValueError("Third-party transcript APIs failed")
 
 
-def get_transcript(video_id: str) -> list:
+async def first_successful(attempts: dict) -> list:
     """
-    Try multiple methods to fetch transcript, with fallbacks.
+    Run transcript fetchers concurrently and return the first result that
+    succeeds, cancelling the others. Raises ValueError listing all failures.
     """
+    tasks = {asyncio.create_task(coro): name for name, coro in attempts.items()}
+    pending = set(tasks)
     errors = []
-    
-    # Method 1: youtube-transcript-api
-    try:
-        ytt = YouTubeTranscriptApi()
-        fetched = ytt.fetch(video_id)
-        return [{"text": s.text, "start": s.start} for s in fetched]
-    except Exception as e:
-        errors.append(f"yt-api: {str(e)[:50]}")
-    
-    # Method 2: Android Innertube (often less restricted)
     try:
-        return get_transcript_innertube_android(video_id)
-    except Exception as e:
-        errors.append(f"android: {str(e)[:50]}")
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    return task.result()
+                except Exception as e:
+                    errors.append(f"{tasks[task]}: {str(e)[:50]}")
+    finally:
+        for task in pending:
+            task.cancel()
+    raise ValueError("; ".join(errors))
+
+
+async def fetch_transcript(video_id: str) -> list:
+    """
+    Try multiple methods to fetch transcript, with fallbacks.
+    """
+    errors = []
     
-    # Method 3: iOS Innertube
+    # Methods 1-2: hedge youtube-transcript-api (blocking, so run on its own
+    # thread pool) against Android Innertube (often less restricted)
     try:
-        return get_transcript_innertube_ios(video_id)
+        return await first_successful({
+            "yt-api": fetch_with_youtube_api(video_id),
+            "android": get_transcript_innertube_android(video_id),
+        })
     except Exception as e:
-        errors.append(f"ios: {str(e)[:50]}")
+        errors.append(str(e))
     
-    # Method 4: TV Innertube
+    # Methods 3-4: race the iOS and TV Innertube clients
     try:
-        return get_transcript_innertube_tv(video_id)
+        return await first_successful({
+            "ios": get_transcript_innertube_ios(video_id),
+            "tv": get_transcript_innertube_tv(video_id),
+        })
     except Exception as e:
-        errors.append(f"tv: {str(e)[:50]}")
+        errors.append(str(e))
     
     # Method 5: Third-party APIs
     try:
-        return get_transcript_third_party(video_id)
+        return await get_transcript_third_party(video_id)
     except Exception as e:
         errors.append(f"3rd-party: {str(e)[:50]}")
     
@@ -324,96 +518,436 @@ def get_transcript(video_id: str) -> list:
     raise ValueError(f"All transcript methods failed: {'; '.join(errors)}")
 
 
-def seconds_to_hhmmss(seconds: float) -> str:
-    seconds = int(seconds)
-    h = seconds // 3600
-    m = (seconds % 3600) // 60
-    s = seconds % 60
+def format_transcript(transcript: list) -> str:
+    """
+    Render the transcript as compact "<index>:<text>" prompt lines, truncated
+    on a line boundary. The LLM answers with an index, which is mapped back to
+    the snippet's start time locally.
+    """
+    # Stop formatting as soon as the budget is spent; long videos would
+    # otherwise format thousands of lines only to throw them away
+    lines = []
+    size = 0
+    for i, (_, text) in enumerate(transcript):
+        line = f"{i}:{text}"
+        size += len(line) + 1
+        if size > MAX_PROMPT_CHARS:
+            if not lines:
+                lines.append(line[:MAX_PROMPT_CHARS])
+            lines.append("... (truncated)")
+            break
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def load_cached_transcript(key: str) -> dict | None:
+    """Read and decode a transcript entry from the disk cache (blocking)."""
+    blob = cache.get(key)
+    if blob is None:
+        return None
+    entry = orjson.loads(gzip.decompress(blob))
+    entry["raw"] = [tuple(snippet) for snippet in entry["raw"]]
+    return entry
+
+
+def build_word_index(transcript: list) -> dict:
+    """Map each lowercase word to the ascending indices of snippets containing it."""
+    index = defaultdict(list)
+    for i, (_, text) in enumerate(transcript):
+        for word in set(_WORD_RE.findall(text.lower())):
+            index[word].append(i)
+    return dict(index)
+
+
+def store_transcript(key: str, transcript: list) -> dict:
+    """Build a transcript entry and write it to the disk cache (blocking)."""
+    entry = {
+        "raw": transcript,
+        "formatted": format_transcript(transcript),
+        "index": build_word_index(transcript),
+    }
+    cache.set(key, gzip.compress(orjson.dumps(entry)), expire=TRANSCRIPT_TTL)
+    return entry
+
+
+async def get_transcript(video_id: str) -> dict:
+    """
+    Return {"raw": [(start, text), ...], "formatted": "...", "index": {...}}
+    for a video, fetching it only on a cache miss. Hot videos are served from
+    memory; everything else from the disk cache, stored as gzip-compressed
+    JSON since caption text is highly redundant.
+    """
+    entry = _transcript_memo.get(video_id)
+    if entry is not None:
+        return entry
+
+    # Disk I/O, (de)compression and formatting run off the event loop
+    key = f"transcript:v4:{video_id}"
+    entry = await asyncio.to_thread(load_cached_transcript, key)
+    if entry is None:
+        transcript = await fetch_transcript(video_id)
+        entry = await asyncio.to_thread(store_transcript, key, transcript)
+
+    _transcript_memo[video_id] = entry
+    return entry
+
+
+def answer_cache_key(video_id: str, topic: str) -> str:
+    """Content-addressed key for a (video, normalized topic) answer."""
+    normalized = f"{video_id}|{topic.strip().lower()}"
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def response_etag(key: str, video_url: str, topic: str) -> str:
+    """
+    Strong ETag for an /ask response. The body echoes video_url and topic
+    as sent, so they are hashed in with the answer key.
+    """
+    tagged = f"{key}|{video_url}|{topic}"
+    return f'"{hashlib.blake2b(tagged.encode("utf-8"), digest_size=16).hexdigest()}"'
+
+
+@lru_cache(maxsize=8192)
+def _format_hhmmss(seconds: int) -> str:
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
     return f"{h:02d}:{m:02d}:{s:02d}"
 
 
-def find_timestamp_with_llm(transcript: list, topic: str) -> str:
-    token = os.environ.get("AIPIPE_TOKEN")
-    if not token:
-        raise RuntimeError("AIPIPE_TOKEN environment variable is not set")
+def seconds_to_hhmmss(seconds: float) -> str:
+    # Cache on whole seconds so starts like 12.34 and 12.87 share an entry
+    return _format_hhmmss(int(seconds))
+
 
-    client = OpenAI(
-        api_key=token,
-        base_url="https://aipipe.org/openrouter/v1"
-    )
+def find_timestamp_locally(transcript: dict, topic: str) -> str | None:
+    """
+    Look for the topic in the transcript without calling the LLM.
+    Returns None when there is no confident match.
+    """
+    topic_lower = " ".join(topic.lower().split())
+    if not topic_lower:
+        return None
+
+    # Pass 1: the word index narrows the search to snippets containing every
+    # topic word; the first of those containing the phrase itself wins
+    raw = transcript["raw"]
+    index = transcript["index"]
+    words = set(_WORD_RE.findall(topic_lower))
+    if words and all(word in index for word in words):
+        postings = sorted((index[word] for word in words), key=len)
+        for i in sorted(set(postings[0]).intersection(*postings[1:])):
+            start, text = raw[i]
+            if topic_lower in " ".join(text.lower().split()):
+                return seconds_to_hhmmss(start)
+
+    norms = [(start, " ".join(text.lower().split())) for start, text in raw]
+
+    # Pass 2: literal substring (catches partial words)
+    for start, text in norms:
+        if topic_lower in text:
+            return seconds_to_hhmmss(start)
+
+    # Pass 3: fuzzy match on the earliest window scoring above the cutoff.
+    # Short snippets are extended with the ones after them until they are at
+    # least as long as the topic, since partial_ratio gives a shorter text
+    # found inside the topic a perfect score ("and" in "sandwich"). A match is
+    # credited to the snippet it starts in, which may lie in the extension.
+    for i, (_, text) in enumerate(norms):
+        window = text
+        ends = [len(window)]
+        j = i + 1
+        while len(window) < len(topic_lower) and j < len(norms):
+            window += " " + norms[j][1]
+            ends.append(len(window))
+            j += 1
+        if len(window) < len(topic_lower):
+            break
+        match = fuzz.partial_ratio_alignment(topic_lower, window, score_cutoff=FUZZY_THRESHOLD)
+        if match:
+            return seconds_to_hhmmss(norms[i + bisect_right(ends, match.dest_start)][0])
+
+    return None
 
-    # Build timestamped transcript text
-    transcript_lines = []
-    for entry in transcript:
-        ts = seconds_to_hhmmss(entry["start"])
-        transcript_lines.append(f"[{ts}] {entry['text']}")
 
-    transcript_text = "\n".join(transcript_lines)
+def snippet_timestamp(transcript: dict, index) -> str | None:
+    """
+    Map a snippet index returned by the LLM back to its HH:MM:SS start.
+    Accepts numeric strings ({"index": "12"}); returns None when the index is
+    missing, malformed or out of range.
+    """
+    raw = transcript["raw"]
+    try:
+        index = int(index)
+    except (TypeError, ValueError):
+        return None
+    if 0 <= index < len(raw):
+        return seconds_to_hhmmss(raw[index][0])
+    return None
+
 
-    # Trim if too long — keep first 12000 chars
-    if len(transcript_text) > 12000:
-        transcript_text = transcript_text[:12000] + "\n... (truncated)"
+# The index may arrive as a number or a numeric string ("12")
+_INDEX_RE = re.compile(r'"index"\s*:\s*"?(\d+)')
+# Only matches once the number is terminated, so a streamed "12" isn't read as "1"
+_INDEX_DONE_RE = re.compile(r'"index"\s*:\s*"?(\d+)"?\s*[,}]')
 
-    prompt = f"""Below is a timestamped transcript from a YouTube video.
 
-Find the FIRST moment where this topic or phrase is spoken or discussed:
+_RESPONSE_FORMAT = {"type": "json_object"}
+
+_PROMPT_TEMPLATE = """Below is a transcript from a YouTube video.
+Each line is one caption snippet, prefixed with its line number ("12:some text").
+
+Find the FIRST line where this topic or phrase is spoken or discussed:
 "{topic}"
 
 TRANSCRIPT:
-{transcript_text}
+{transcript}
 
 Respond ONLY with a valid JSON object:
-{{"timestamp": "HH:MM:SS"}}
+{{"index": <line number>}}
 
 Rules:
-- Return the EXACT timestamp from the transcript where the topic FIRST appears
-- Format MUST be HH:MM:SS (e.g. "00:05:47", "01:23:45")
+- Return the line number where the topic FIRST appears
 - Return ONLY the JSON, no explanation"""
 
-    response = client.chat.completions.create(
-        model="google/gemini-2.5-pro-preview-03-25",
+_BATCH_PROMPT_TEMPLATE = """Below is a transcript from a YouTube video.
+Each line is one caption snippet, prefixed with its line number ("12:some text").
+
+For EACH numbered topic or phrase below, find the FIRST line where it is spoken or discussed:
+{topics}
+
+TRANSCRIPT:
+{transcript}
+
+Respond ONLY with a valid JSON object:
+{{"results": [{{"idx": <topic number>, "index": <line number>}}, ...]}}
+
+Rules:
+- Include one result per topic, using the topic's number as "idx"
+- Return the line number where each topic FIRST appears as "index"
+- Return ONLY the JSON, no explanation"""
+
+
+async def find_timestamp_with_llm(transcript: dict, topic: str) -> str | None:
+    prompt = _PROMPT_TEMPLATE.format(topic=topic, transcript=transcript["formatted"])
+
+    stream = await _CLIENT.chat.completions.create(
+        model=LLM_MODEL,
         messages=[{"role": "user", "content": prompt}],
-        response_format={"type": "json_object"}
+        response_format=_RESPONSE_FORMAT,
+        max_tokens=LLM_REASONING_TOKENS + LLM_MAX_TOKENS,
+        temperature=0,
+        extra_body={"reasoning": LLM_REASONING},
+        stream=True
     )
 
-    raw = response.choices[0].message.content.strip()
+    # Stop decoding as soon as the index field has been closed
+    raw = ""
+    index = None
+    finish_reason = None
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        raw += chunk.choices[0].delta.content or ""
+        finish_reason = chunk.choices[0].finish_reason or finish_reason
+        match = _INDEX_DONE_RE.search(raw)
+        if match:
+            index = int(match.group(1))
+            await stream.close()
+            break
+
+    if index is None:
+        raw = raw.strip()
+        try:
+            index = orjson.loads(raw).get("index")
+        except Exception:
+            match = _INDEX_RE.search(raw)
+            index = int(match.group(1)) if match else None
+
+    timestamp = snippet_timestamp(transcript, index)
+    if timestamp is None:
+        logger.warning(
+            "LLM reply had no usable index (finish_reason=%s): %.200r", finish_reason, raw
+        )
+    return timestamp
+
+
+async def find_timestamps_with_llm(transcript: dict, topics: list) -> list:
+    """
+    Find the first timestamp for several topics in one LLM call.
+    Returns timestamps in the same order as topics, None where the reply
+    had no usable answer.
+    """
+    topic_lines = "\n".join(f'{i}. "{topic}"' for i, topic in enumerate(topics))
+
+    prompt = _BATCH_PROMPT_TEMPLATE.format(topics=topic_lines, transcript=transcript["formatted"])
+
+    response = await _CLIENT.chat.completions.create(
+        model=LLM_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        response_format=_RESPONSE_FORMAT,
+        max_tokens=LLM_REASONING_TOKENS + LLM_MAX_TOKENS * len(topics),
+        temperature=0,
+        extra_body={"reasoning": LLM_REASONING},
+    )
 
+    choice = response.choices[0]
+    raw = (choice.message.content or "").strip()
+
+    timestamps = [None] * len(topics)
     try:
-        result = json.loads(raw)
-        timestamp = result.get("timestamp", "00:00:00")
+        results = orjson.loads(raw).get("results", [])
     except Exception:
-        match = re.search(r"\d{1,2}:\d{2}:\d{2}", raw)
-        timestamp = match.group(0) if match else "00:00:00"
-
-    # Normalize to HH:MM:SS
-    parts = timestamp.split(":")
-    if len(parts) == 2:
-        timestamp = f"00:{parts[0].zfill(2)}:{parts[1].zfill(2)}"
-    elif len(parts) == 3:
-        timestamp = f"{parts[0].zfill(2)}:{parts[1].zfill(2)}:{parts[2].zfill(2)}"
-    else:
-        timestamp = "00:00:00"
+        results = []
+    for result in results:
+        if not isinstance(result, dict):
+            continue
+        try:
+            idx = int(result.get("idx"))
+        except (TypeError, ValueError):
+            continue
+        if 0 <= idx < len(topics):
+            timestamps[idx] = snippet_timestamp(transcript, result.get("index"))
+
+    missing = timestamps.count(None)
+    if missing:
+        logger.warning(
+            "LLM batch reply had no usable index for %d of %d topics (finish_reason=%s): %.200r",
+            missing, len(topics), choice.finish_reason, raw
+        )
+    return timestamps
+
+
+def fail_llm_futures(futures: list, exc: BaseException):
+    """Resolve every still-pending lookup future with exc."""
+    for fut in futures:
+        if not fut.done():
+            fut.set_exception(exc)
+
+
+def queued_futures(items: list) -> list:
+    """Futures of (..., future) queue items, skipping anything malformed."""
+    return [
+        item[-1] for item in items
+        if isinstance(item, tuple) and item and isinstance(item[-1], asyncio.Future)
+    ]
 
-    return timestamp
+
+async def resolve_llm_batch(transcript: dict, items: list):
+    """Answer every (topic, future) pair that shares one transcript."""
+    topics = [topic for topic, _ in items]
+    futures = [fut for _, fut in items]
+    try:
+        if len(topics) == 1:
+            timestamps = [await find_timestamp_with_llm(transcript, topics[0])]
+        else:
+            timestamps = await find_timestamps_with_llm(transcript, topics)
+        for fut, timestamp in zip(futures, timestamps):
+            if not fut.done():
+                fut.set_result(timestamp)
+    except Exception as e:
+        fail_llm_futures(futures, e)
+    finally:
+        # Never leave a caller waiting, e.g. when cancelled at shutdown
+        fail_llm_futures(futures, RuntimeError("LLM lookup was cancelled"))
+
+
+async def llm_batcher():
+    """
+    Background task: drain the LLM queue in small time-boxed batches and
+    issue one LLM call per distinct transcript in each batch.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await llm_queue.get()]
+        # A failing batch must not kill the task, or every later lookup
+        # would wait forever on its future
+        try:
+            deadline = loop.time() + MAX_WAIT
+            while len(batch) < MAX_BATCH:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(llm_queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            groups = {}
+            for transcript, topic, fut in batch:
+                _, items = groups.setdefault(transcript["formatted"], (transcript, []))
+                items.append((topic, fut))
+
+            for transcript, items in groups.values():
+                task = asyncio.create_task(resolve_llm_batch(transcript, items))
+                _batch_tasks.add(task)
+                task.add_done_callback(_batch_tasks.discard)
+        except asyncio.CancelledError:
+            fail_llm_futures(queued_futures(batch), RuntimeError("Server is shutting down"))
+            raise
+        except Exception as e:
+            logger.exception("Failed to dispatch LLM batch")
+            fail_llm_futures(queued_futures(batch), e)
+
+
+async def ask_llm(transcript: dict, topic: str) -> str | None:
+    """Queue a lookup for the batcher and wait for its answer."""
+    fut = asyncio.get_running_loop().create_future()
+    await llm_queue.put((transcript, topic, fut))
+    return await fut
 
 
 @app.post("/ask", response_model=AskResponse)
-async def ask(request: AskRequest):
+async def ask(
+    request: AskRequest,
+    response: Response,
+    if_none_match: str | None = Header(default=None),
+):
     try:
         video_id = extract_video_id(request.video_url)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid video URL: {str(e)}")
 
+    # The answer is deterministic for a (video, normalized topic) pair, so the
+    # cache key plus the echoed fields identify the response body; clients
+    # that already hold it get a 304
+    key = answer_cache_key(video_id, request.topic)
+    etag = response_etag(key, request.video_url, request.topic)
+    if if_none_match and etag in {t.strip().removeprefix("W/") for t in if_none_match.split(",")}:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # diskcache is SQLite; under multi-worker contention a read or write can
+    # wait on the database lock, so keep it off the event loop
+    timestamp = await asyncio.to_thread(cache.get, key)
+    if timestamp is not None:
+        response.headers["ETag"] = etag
+        response.headers["X-Cache"] = "HIT"
+        return AskResponse(
+            timestamp=timestamp,
+            video_url=request.video_url,
+            topic=request.topic
+        )
+
     try:
-        transcript = get_transcript(video_id)
+        transcript = await get_transcript(video_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Transcript error: {str(e)}")
 
+    timestamp = await asyncio.to_thread(find_timestamp_locally, transcript, request.topic)
+
     try:
-        timestamp = find_timestamp_with_llm(transcript, request.topic)
+        if timestamp is None:
+            timestamp = await ask_llm(transcript, request.topic)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM error: {str(e)}")
 
+    # Only real answers are cached and tagged; an unusable LLM reply falls
+    # back to 00:00:00 for this response alone
+    if timestamp is not None:
+        await asyncio.to_thread(cache.set, key, timestamp, expire=ANSWER_TTL)
+        response.headers["ETag"] = etag
+    else:
+        timestamp = "00:00:00"
+    response.headers["X-Cache"] = "MISS"
     return AskResponse(
         timestamp=timestamp,
         video_url=request.video_url,
@@ -0,0 +1,81 @@
+import os
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+
+# main reads these at import time
+os.environ.setdefault("AIPIPE_TOKEN", "test-token")
+os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="ytf-test-cache-")
+
+import main  # noqa: E402
+
+
+def make_transcript(snippets: list) -> dict:
+    """Build a transcript entry the way store_transcript does, minus the disk write."""
+    return {
+        "raw": snippets,
+        "formatted": main.format_transcript(snippets),
+        "index": main.build_word_index(snippets),
+    }
+
+
+class FakeStream:
+    """Streamed chat completion that yields the reply a few characters at a time."""
+
+    def __init__(self, content: str, finish_reason: str = "stop"):
+        self.content = content
+        self.finish_reason = finish_reason
+        self.closed = False
+
+    async def __aiter__(self):
+        pieces = [self.content[i:i + 3] for i in range(0, len(self.content), 3)] or [""]
+        for n, piece in enumerate(pieces):
+            finish_reason = self.finish_reason if n == len(pieces) - 1 else None
+            yield SimpleNamespace(choices=[
+                SimpleNamespace(delta=SimpleNamespace(content=piece), finish_reason=finish_reason)
+            ])
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeLLM:
+    """
+    Stands in for AsyncOpenAI. reply(kwargs) returns the completion text for
+    each create() call (or awaits, if it is a coroutine function); every
+    call's kwargs are recorded in calls.
+    """
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        content = self.reply(kwargs)
+        if hasattr(content, "__await__"):
+            content = await content
+        if kwargs.get("stream"):
+            return FakeStream(content)
+        return SimpleNamespace(choices=[
+            SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")
+        ])
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    main.cache.clear()
+    main._transcript_memo.clear()
+    yield
+    main.cache.clear()
+    main._transcript_memo.clear()
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """Install a FakeLLM as main._CLIENT; set .reply to control its answers."""
+    llm = FakeLLM(lambda kwargs: '{"index": 0}')
+    monkeypatch.setattr(main, "_CLIENT", llm)
+    return llm
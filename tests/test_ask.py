@@ -0,0 +1,107 @@
+import pytest
+from conftest import make_transcript
+from fastapi.testclient import TestClient
+
+import main
+
+URL = "https://youtu.be/dQw4w9WgXcQ"
+SNIPPETS = [(0.0, "welcome everyone"), (65.0, "today machine learning basics"), (3700.0, "wrap up")]
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Serve SNIPPETS for every transcript fetch and count the fetches."""
+    calls = []
+
+    async def fake_fetch(video_id):
+        calls.append(video_id)
+        return list(SNIPPETS)
+
+    monkeypatch.setattr(main, "fetch_transcript", fake_fetch)
+    return calls
+
+
+@pytest.fixture
+def client(fake_llm, fetches):
+    with TestClient(main.app) as client:
+        yield client
+
+
+def ask(client, topic, url=URL, **headers):
+    return client.post("/ask", json={"video_url": url, "topic": topic}, headers=headers)
+
+
+def test_miss_then_hit_with_etag(client, fetches, fake_llm):
+    first = ask(client, "machine learning")
+    assert first.status_code == 200
+    assert first.json() == {"timestamp": "00:01:05", "video_url": URL, "topic": "machine learning"}
+    assert first.headers["x-cache"] == "MISS"
+    assert first.headers["etag"]
+
+    second = ask(client, "machine learning")
+    assert second.json() == first.json()
+    assert second.headers["x-cache"] == "HIT"
+    assert second.headers["etag"] == first.headers["etag"]
+    assert fetches == ["dQw4w9WgXcQ"]
+    assert fake_llm.calls == []
+
+
+def test_matching_if_none_match_gets_304(client, fetches):
+    etag = ask(client, "machine learning").headers["etag"]
+
+    for header in (etag, f"W/{etag}", f'"other", {etag}'):
+        response = ask(client, "machine learning", **{"If-None-Match": header})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+    assert ask(client, "machine learning", **{"If-None-Match": '"stale"'}).status_code == 200
+    assert len(fetches) == 1
+
+
+def test_etag_covers_echoed_fields(client, fetches):
+    first = ask(client, "Machine Learning")
+    second = ask(client, "machine learning ", url="https://www.youtube.com/watch?v=dQw4w9WgXcQ")
+    # Same normalized answer, so the second is served from the answer cache
+    assert second.headers["x-cache"] == "HIT"
+    assert second.json()["timestamp"] == first.json()["timestamp"]
+    assert second.headers["etag"] != first.headers["etag"]
+
+    stale = ask(client, "machine learning ", **{"If-None-Match": first.headers["etag"]})
+    assert stale.status_code == 200
+
+
+def test_llm_answer_is_cached(client, fake_llm):
+    fake_llm.reply = lambda kwargs: '{"index": 2}'
+    first = ask(client, "closing remarks")
+    assert first.json()["timestamp"] == "01:01:40"
+    assert first.headers["x-cache"] == "MISS"
+
+    second = ask(client, "closing remarks")
+    assert second.headers["x-cache"] == "HIT"
+    assert len(fake_llm.calls) == 1
+
+
+def test_unusable_llm_reply_is_not_cached_or_tagged(client, fake_llm):
+    fake_llm.reply = lambda kwargs: "garbled"
+    for _ in range(2):
+        response = ask(client, "the intro")
+        assert response.json()["timestamp"] == "00:00:00"
+        assert response.headers["x-cache"] == "MISS"
+        assert "etag" not in response.headers
+    assert len(fake_llm.calls) == 2
+
+
+def test_cors_exposes_cache_headers(client):
+    response = client.post(
+        "/ask",
+        json={"video_url": URL, "topic": "machine learning"},
+        headers={"Origin": "https://example.com"},
+    )
+    exposed = {h.strip().lower() for h in response.headers["access-control-expose-headers"].split(",")}
+    assert {"etag", "x-cache"} <= exposed
+
+
+def test_invalid_url_is_rejected(client):
+    response = ask(client, "anything", url="https://example.com/video")
+    assert response.status_code == 400
@@ -0,0 +1,57 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+
+
+class ChunkedStream(httpx.AsyncByteStream):
+    """Response body served in fixed chunks, recording how many were read."""
+
+    def __init__(self, chunks: list):
+        self.chunks = chunks
+        self.sent = 0
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            self.sent += 1
+            yield chunk
+
+
+def fetch_tracks(monkeypatch, stream: ChunkedStream) -> list:
+    async def run():
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, stream=stream))
+        async with httpx.AsyncClient(transport=transport) as client:
+            monkeypatch.setattr(main, "http_client", client)
+            return await main.fetch_innertube_caption_tracks(
+                "https://www.youtube.com/youtubei/v1/player", {"videoId": "x"}, {}
+            )
+    return asyncio.run(run())
+
+
+def test_stops_reading_once_caption_tracks_close(monkeypatch):
+    stream = ChunkedStream([
+        b'{"playabilityStatus": {"status": "OK"}, "captions": {"playerCaptionsTracklistRenderer": ',
+        b'{"captionTracks": [{"baseUrl": "https://a", "languageCode": "en"}, ',
+        b'{"baseUrl": "https://b", "languageCode": "de", "name": {"runs": [{"text": "German"}]}}]',
+        b'}}, "streamingData": {"formats": [',
+        b'{"itag": 18}]}}',
+    ])
+    tracks = fetch_tracks(monkeypatch, stream)
+    assert tracks == [
+        {"baseUrl": "https://a", "languageCode": "en"},
+        {"baseUrl": "https://b", "languageCode": "de", "name": {"runs": [{"text": "German"}]}},
+    ]
+    assert stream.sent == 3
+
+
+def test_video_without_captions_returns_no_tracks(monkeypatch):
+    stream = ChunkedStream([b'{"playabilityStatus": {"status": "OK"}, "videoDetails": {"videoId": "x"}}'])
+    assert fetch_tracks(monkeypatch, stream) == []
+
+
+def test_playability_error_raises(monkeypatch):
+    stream = ChunkedStream([b'{"playabilityStatus": {"status": "ERROR", "reason": "Video unavailable"}}'])
+    with pytest.raises(ValueError, match="Video unavailable"):
+        fetch_tracks(monkeypatch, stream)
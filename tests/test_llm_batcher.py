@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+from conftest import make_transcript
+
+import main
+
+VIDEO_A = make_transcript([(0.0, "intro"), (65.0, "neural networks"), (130.0, "outro")])
+VIDEO_B = make_transcript([(0.0, "hello"), (3600.0, "goodbye")])
+
+
+async def in_lifespan(body):
+    async with main.lifespan(main.app):
+        return await body()
+
+
+def test_concurrent_lookups_are_grouped_per_transcript(fake_llm):
+    def reply(kwargs):
+        if kwargs.get("stream"):
+            return '{"index": 1}'
+        return '{"results": [{"idx": 0, "index": 1}, {"idx": 1, "index": 2}, {"idx": 2, "index": 0}]}'
+    fake_llm.reply = reply
+
+    async def body():
+        return await asyncio.gather(
+            main.ask_llm(VIDEO_A, "networks"),
+            main.ask_llm(VIDEO_A, "closing"),
+            main.ask_llm(VIDEO_A, "opening"),
+            main.ask_llm(VIDEO_B, "farewell"),
+        )
+
+    assert asyncio.run(in_lifespan(body)) == ["00:01:05", "00:02:10", "00:00:00", "01:00:00"]
+    # One batched call for video A, one streamed single lookup for video B
+    assert len(fake_llm.calls) == 2
+    batched = next(call for call in fake_llm.calls if not call.get("stream"))
+    assert batched["max_tokens"] == main.LLM_REASONING_TOKENS + 3 * main.LLM_MAX_TOKENS
+    assert batched["extra_body"] == {"reasoning": main.LLM_REASONING}
+
+
+def test_single_lookup_accepts_string_index(fake_llm):
+    fake_llm.reply = lambda kwargs: '{"index": "2"}'
+
+    async def body():
+        return await main.ask_llm(VIDEO_A, "ending")
+
+    assert asyncio.run(in_lifespan(body)) == "00:02:10"
+
+
+def test_malformed_batch_replies_leave_gaps(fake_llm):
+    fake_llm.reply = lambda kwargs: (
+        '{"results": [{"idx": "1", "index": "2"}, "junk", {"idx": 9, "index": 0}, {"idx": 0}]}'
+    )
+
+    async def body():
+        return await main.find_timestamps_with_llm(VIDEO_A, ["a", "b", "c"])
+
+    assert asyncio.run(body()) == [None, "00:02:10", None]
+
+
+def test_unusable_single_reply_is_logged(fake_llm, caplog):
+    fake_llm.reply = lambda kwargs: "sorry, I cannot help"
+
+    async def body():
+        return await main.find_timestamp_with_llm(VIDEO_A, "anything")
+
+    assert asyncio.run(body()) is None
+    assert "no usable index" in caplog.text
+
+
+def test_llm_errors_reach_the_caller_and_batcher_survives(fake_llm):
+    def reply(kwargs):
+        if "explode" in kwargs["messages"][0]["content"]:
+            raise RuntimeError("upstream 500")
+        return '{"index": 0}'
+    fake_llm.reply = reply
+
+    async def body():
+        # A malformed queue item fails its own batch without killing the batcher
+        await main.llm_queue.put(("bogus",))
+        await asyncio.sleep(main.MAX_WAIT * 2)
+        with pytest.raises(RuntimeError, match="upstream 500"):
+            await main.ask_llm(VIDEO_A, "explode")
+        return await main.ask_llm(VIDEO_B, "greeting")
+
+    assert asyncio.run(in_lifespan(body)) == "00:00:00"
+
+
+def test_shutdown_fails_in_flight_and_queued_lookups(fake_llm):
+    async def hang(kwargs):
+        await asyncio.Event().wait()
+    fake_llm.reply = hang
+
+    async def run():
+        async with main.lifespan(main.app):
+            in_flight = asyncio.create_task(main.ask_llm(VIDEO_A, "stuck"))
+            while not fake_llm.calls:
+                await asyncio.sleep(0.01)
+            queued = asyncio.get_running_loop().create_future()
+            main.llm_queue.put_nowait((VIDEO_B, "late", queued))
+        for fut in (in_flight, queued):
+            with pytest.raises(RuntimeError):
+                await asyncio.wait_for(fut, 1)
+
+    asyncio.run(run())
@@ -0,0 +1,71 @@
+from conftest import make_transcript
+
+import main
+
+
+def test_word_index_requires_the_phrase_in_order():
+    transcript = make_transcript([
+        (0.0, "learning about machine shops"),
+        (30.0, "now machine learning"),
+        (60.0, "machine learning again"),
+    ])
+    assert main.find_timestamp_locally(transcript, "Machine  Learning") == "00:00:30"
+
+
+def test_substring_pass_matches_partial_words():
+    transcript = make_transcript([
+        (0.0, "hello there"),
+        (75.0, "the tokenizers we use"),
+    ])
+    # "tokenizer" is not a whole word of any snippet, so only pass 2 finds it
+    assert main.find_timestamp_locally(transcript, "tokenizer") == "00:01:15"
+
+
+def test_fuzzy_pass_tolerates_typos():
+    transcript = make_transcript([
+        (0.0, "welcome back"),
+        (3725.0, "lets make a sandwhich today"),
+    ])
+    assert main.find_timestamp_locally(transcript, "sandwich") == "01:02:05"
+
+
+def test_fuzzy_pass_ignores_short_snippets_inside_the_topic():
+    transcript = make_transcript([
+        (0.0, "and"),
+        (10.0, "completely unrelated talk"),
+    ])
+    assert main.find_timestamp_locally(transcript, "sandwich") is None
+
+
+def test_fuzzy_pass_joins_short_snippets_into_a_window():
+    transcript = make_transcript([
+        (0.0, "intro"),
+        (20.0, "gradient"),
+        (21.5, "desent step"),
+    ])
+    assert main.find_timestamp_locally(transcript, "gradient descent") == "00:00:20"
+
+
+def test_fuzzy_pass_finds_matches_in_trailing_short_snippets():
+    transcript = make_transcript([
+        (0.0, "intro"),
+        (20.0, "gradient"),
+        (21.5, "desent"),
+    ])
+    assert main.find_timestamp_locally(transcript, "gradient descent") == "00:00:20"
+
+
+def test_no_match_and_blank_topic():
+    transcript = make_transcript([(0.0, "nothing to see here")])
+    assert main.find_timestamp_locally(transcript, "quantum chromodynamics") is None
+    assert main.find_timestamp_locally(transcript, "   ") is None
+
+
+def test_snippet_timestamp_coerces_and_bounds_indices():
+    transcript = make_transcript([(0.0, "a"), (12.9, "b")])
+    assert main.snippet_timestamp(transcript, 1) == "00:00:12"
+    assert main.snippet_timestamp(transcript, "1") == "00:00:12"
+    assert main.snippet_timestamp(transcript, 2) is None
+    assert main.snippet_timestamp(transcript, -1) is None
+    assert main.snippet_timestamp(transcript, "one") is None
+    assert main.snippet_timestamp(transcript, None) is None